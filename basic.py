@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import re
+import threading
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib codec
+    orjson = None
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from openai import OpenAI
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 
 # -------------------- config --------------------
@@ -19,62 +29,147 @@ WORKSPACE = Path(os.getenv("CODE_WRITER_WORKSPACE", "./workspace")).resolve()
 WORKSPACE.mkdir(parents=True, exist_ok=True)
 
 MAX_BYTES = int(os.getenv("CODE_WRITER_MAX_BYTES", "200000"))  # cap per write
+READ_CACHE_SIZE = int(os.getenv("CODE_WRITER_READ_CACHE_SIZE", "128"))  # files kept by read_python_file
+
+
+# -------------------- json helpers --------------------
+
+def _dumps(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def _loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 # -------------------- safety helpers --------------------
 
-def _safe_py_path(rel_path: str) -> Path:
+_WS = str(WORKSPACE)
+_WS_SEP = _WS + os.sep
 
-    p = Path(rel_path)
 
-    if p.is_absolute():
-        raise ValueError("Absolute paths are not allowed.")
-    if ".." in p.parts:
-        raise ValueError("Path traversal ('..') is not allowed.")
-    if p.suffix.lower() != ".py":
-        raise ValueError("Only .py files are allowed.")
+# relative (no leading separator or drive), no '..' segment, no NUL, ends in .py
+_VALID_PY_PATH = re.compile(
+    r"(?![/\\])(?![A-Za-z]:)(?!(?:.*[/\\])?\.\.(?:[/\\]|\Z))(?:[^\0]*[/\\])?[^/\\\0]+\.py\Z",
+    re.IGNORECASE | re.DOTALL,
+)
 
-    resolved = (WORKSPACE / p).resolve()
-    if resolved != WORKSPACE and WORKSPACE not in resolved.parents:
+
+def _bad_py_path(rel_path: str) -> ValueError:
+    # slow path, only to explain why _VALID_PY_PATH rejected the path
+    if os.path.isabs(rel_path) or rel_path[:1] in ("/", "\\"):
+        return ValueError("Absolute paths are not allowed.")
+    if ".." in rel_path.replace("\\", "/").split("/"):
+        return ValueError("Path traversal ('..') is not allowed.")
+    if rel_path[-3:].lower() != ".py":
+        return ValueError("Only .py files are allowed.")
+    if rel_path.replace("\\", "/").rsplit("/", 1)[-1].lower() == ".py":
+        return ValueError("File name is missing before '.py'.")
+    return ValueError(f"Invalid path: {rel_path!r}")
+
+
+def _safe_py_path(rel_path: str) -> Path:
+    if not _VALID_PY_PATH.match(rel_path):
+        raise _bad_py_path(rel_path)
+
+    resolved = os.path.normpath(os.path.join(_WS, rel_path))
+    if resolved != _WS and not resolved.startswith(_WS_SEP):
         raise ValueError("Path escapes workspace.")
-    return resolved
+    # only pay for realpath() when a symlink could redirect the path
+    if os.path.islink(resolved) or _dir_has_symlink(os.path.dirname(resolved)):
+        resolved = os.path.realpath(resolved)
+        if resolved != _WS and not resolved.startswith(_WS_SEP):
+            raise ValueError("Path escapes workspace.")
+    return Path(resolved)
+
+
+def _dir_has_symlink(dir_path: str) -> bool:
+    # True if dir_path or any ancestor below the workspace root is a symlink; checked on every
+    # call (not cached) because a directory can be replaced by a symlink between calls
+    if dir_path == _WS or not dir_path.startswith(_WS_SEP):
+        return False
+    return os.path.islink(dir_path) or _dir_has_symlink(os.path.dirname(dir_path))
+
+
+def _write_all(fp: Path, data: bytes, overwrite: bool) -> None:
+    # O_EXCL makes "must not exist" part of the open itself (no stat, no race);
+    # one encode, raw os.write calls, looping in case the kernel accepts a short write
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if overwrite else os.O_EXCL)
+    try:
+        fd = os.open(str(fp), flags, 0o644)
+    except FileNotFoundError:
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(fp), flags, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        os.close(fd)
+
+
+# resolved path -> (mtime_ns, size, requested path, JSON result); LRU ordered
+_READ_CACHE: "OrderedDict[str, Tuple[int, int, str, str]]" = OrderedDict()
+_READ_CACHE_LOCK = threading.Lock()  # tools run concurrently in worker threads
 
 
 def read_python_file(path: str) -> str:
     try:
         fp = _safe_py_path(path)
-        if not fp.exists():
-            return json.dumps({"ok": False, "error": "File not found", "path": path})
-        content = fp.read_text(encoding="utf-8")
-        return json.dumps({"ok": True, "path": path, "content": content})
+        key = str(fp)
+        try:
+            st = os.stat(key)
+        except FileNotFoundError:
+            return _dumps({"ok": False, "error": "File not found", "path": path})
+
+        with _READ_CACHE_LOCK:
+            cached = _READ_CACHE.get(key)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size and cached[2] == path:
+                _READ_CACHE.move_to_end(key)
+                return cached[3]
+
+        content = fp.read_bytes().decode("utf-8")
+        result = _dumps({"ok": True, "path": path, "content": content})
+        with _READ_CACHE_LOCK:
+            _READ_CACHE[key] = (st.st_mtime_ns, st.st_size, path, result)
+            _READ_CACHE.move_to_end(key)
+            while len(_READ_CACHE) > READ_CACHE_SIZE:
+                _READ_CACHE.popitem(last=False)
+        return result
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e), "path": path})
+        return _dumps({"ok": False, "error": str(e), "path": path})
 
 
 def write_python_file(path: str, content: str, overwrite: bool = False) -> str:
     try:
         fp = _safe_py_path(path)
 
-        if fp.exists() and not overwrite:
-            return json.dumps({
-                "ok": False,
-                "error": "File exists; set overwrite=true to replace it.",
-                "path": path
-            })
-
         data = content.encode("utf-8")
         if len(data) > MAX_BYTES:
-            return json.dumps({
+            return _dumps({
                 "ok": False,
                 "error": f"Content too large ({len(data)} bytes > {MAX_BYTES}).",
                 "path": path
             })
 
-        fp.parent.mkdir(parents=True, exist_ok=True)
-        fp.write_text(content, encoding="utf-8")
-        return json.dumps({"ok": True, "path": path, "bytes_written": len(data)})
+        try:
+            _write_all(fp, data, overwrite)
+        except FileExistsError:
+            return _dumps({
+                "ok": False,
+                "error": "File exists; set overwrite=true to replace it.",
+                "path": path
+            })
+        with _READ_CACHE_LOCK:
+            _READ_CACHE.pop(str(fp), None)
+        return _dumps({"ok": True, "path": path, "bytes_written": len(data)})
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e), "path": path})
+        return _dumps({"ok": False, "error": str(e), "path": path})
 
 # -------------------- tool definitions --------------------
 TOOLS = [
@@ -121,31 +216,71 @@ TOOLS = [
 ]
 
 
+_DISPATCH: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "read_python_file": lambda a: read_python_file(path=str(a["path"])),
+    "write_python_file": lambda a: write_python_file(
+        path=str(a["path"]),
+        content=str(a["content"]),
+        overwrite=bool(a.get("overwrite", False)),
+    ),
+}
+
+
 def call_tool(name: str, args: Dict[str, Any]) -> str:
-    if name == "read_python_file":
-        return read_python_file(path=str(args["path"]))
-    if name == "write_python_file":
-        return write_python_file(
-            path=str(args["path"]),
-            content=str(args["content"]),
-            overwrite=bool(args.get("overwrite", False)),
-        )
-    return json.dumps({"ok": False, "error": f"Unknown tool: {name}"})
+    fn = _DISPATCH.get(name)
+    if fn is None:
+        return _dumps({"ok": False, "error": f"Unknown tool: {name}"})
+    try:
+        return fn(args)
+    except KeyError as e:
+        return _dumps({"ok": False, "error": f"Missing argument: {e.args[0]}"})
+
+
+def _parse_args(raw: Any) -> Dict[str, Any]:
+    if isinstance(raw, dict):
+        return raw
+    if not raw or not isinstance(raw, (str, bytes, bytearray)):
+        return {}
+    try:
+        args = _loads(raw)
+    except json.JSONDecodeError:
+        return {}
+    return args if isinstance(args, dict) else {}
+
+
+async def _dispatch(tc: Any) -> str:
+    args = _parse_args(tc.arguments)
+    # tools do blocking file IO; run them off the event loop so calls overlap
+    return await asyncio.to_thread(call_tool, tc.name, args)
 
 
 # -------------------- CLI loop --------------------
 
-@dataclass
+@dataclass(slots=True)
 class Usage:
     input_tokens: int = 0
     output_tokens: int = 0
 
     def add_from_response(self, response: Any) -> None:
-        u = getattr(response, "usage", None)
-        if not u:
+        u = response.usage
+        if u is None:
             return
-        self.input_tokens += int(getattr(u, "input_tokens", 0) or 0)
-        self.output_tokens += int(getattr(u, "output_tokens", 0) or 0)
+        self.input_tokens += u.input_tokens or 0
+        self.output_tokens += u.output_tokens or 0
+
+
+async def _stream_response(client: AsyncOpenAI, **kwargs: Any) -> Any:
+    """Stream a response, echoing text deltas as they arrive; returns the final response."""
+    streamed = False
+    async with client.responses.stream(**kwargs) as stream:
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                print(event.delta, end="", flush=True)
+                streamed = True
+        response = await stream.get_final_response()
+    if streamed:
+        print()
+    return response
 
 
 def debug_print_response(response):
@@ -168,8 +303,54 @@ def debug_print_response(response):
                     print("    text:", block.text)
 
 
-def main() -> int:
-    client = OpenAI()
+def _make_client() -> AsyncOpenAI:
+    # openai/httpx pull in pydantic, anyio, ...; only pay for them once a client is needed
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    # one pooled HTTP/2 client reused for every turn, so TLS/TCP setup is paid once
+    http_client = DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+        timeout=httpx.Timeout(600.0, connect=5.0),
+    )
+    return AsyncOpenAI(http_client=http_client)
+
+
+async def _read_line(prompt: str) -> str:
+    """input() on a daemon thread, so Ctrl-C at the prompt is not stuck behind a blocked executor join."""
+    loop = asyncio.get_running_loop()
+    fut: asyncio.Future[str] = loop.create_future()
+
+    def settle(value: Any, exc: Optional[BaseException]) -> None:
+        if fut.done():  # the await was cancelled while the read was blocked
+            return
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(value)
+
+    def read() -> None:
+        try:
+            line = input(prompt)
+        except BaseException as e:  # EOFError/KeyboardInterrupt surface in the awaiting task
+            loop.call_soon_threadsafe(settle, None, e)
+        else:
+            loop.call_soon_threadsafe(settle, line, None)
+
+    threading.Thread(target=read, name="repl-input", daemon=True).start()
+    return await fut
+
+
+async def main() -> int:
+    client = _make_client()
+    try:
+        return await _repl(client)
+    finally:
+        await client.close()
+
+
+async def _repl(client: AsyncOpenAI) -> int:
     usage = Usage()
 
     instructions = (
@@ -181,56 +362,56 @@ def main() -> int:
         "After tool calls are done, explain what you wrote/changed and which files.\n"
     )
 
-    input_items: List[Dict[str, Any]] = []
+    # The conversation lives server-side (store=True); only items not yet sent are kept here.
+    pending: Deque[Dict[str, Any]] = deque()
+    last_response_id: Optional[str] = None
 
     print(f"Workspace: {WORKSPACE}")
     print("Type '/clear' to reset, 'exit' to quit.\n")
 
     while True:
-        user = input("> ").strip()
+        user = (await _read_line("> ")).strip()
         if not user:
             continue
         if user == "exit":
             break
         if user == "/clear":
-            input_items = []
+            pending.clear()
+            last_response_id = None
             usage = Usage()
             print("(cleared)\n")
             continue
 
-        input_items.append({"role": "user", "content": user})
+        pending.append({"role": "user", "content": user})
 
         for _ in range(10):
-            response = client.responses.create(
+            response = await _stream_response(
+                client,
                 model=DEFAULT_MODEL,
                 instructions=instructions,
                 tools=TOOLS,
-                input=input_items,
+                input=list(pending),
+                previous_response_id=last_response_id,
+                store=True,
             )
             usage.add_from_response(response)
 
             # debug_print_response(response)
 
 
-            input_items += response.output
+            last_response_id = response.id
+            pending.clear()
 
             tool_calls = [item for item in response.output if item.type == "function_call"]
             if tool_calls:
-                for tc in tool_calls:
-                    try:
-                        args = json.loads(tc.arguments or "{}")
-                    except json.JSONDecodeError:
-                        args = {}
-                    result = call_tool(tc.name, args)
-
-                    input_items.append({
-                        "type": "function_call_output",
-                        "call_id": tc.call_id,
-                        "output": result,
-                    })
+                results = await asyncio.gather(*[_dispatch(tc) for tc in tool_calls])
+                # all outputs go back together as the next request's input
+                pending.extend(
+                    {"type": "function_call_output", "call_id": tc.call_id, "output": result}
+                    for tc, result in zip(tool_calls, results)
+                )
                 continue
 
-            print(response.output_text)
             break
 
         print(f"\n[tokens] ↑ {usage.input_tokens} ↓ {usage.output_tokens}\n")
@@ -239,4 +420,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(asyncio.run(main()))
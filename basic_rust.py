@@ -1,15 +1,28 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import atexit
+import os
+import sys
+import threading
+from collections import deque
 from dataclasses import dataclass
-from typing import Any, Dict, List
-
-from openai import OpenAI
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, List, Optional
 
 import config
+from codec import JSONDecodeError, _dumps, _dumps_pretty, _dumps_pretty_bytes, _loads
 from files import read_file, write_file
-from patches import propose_patch, apply_patch_file, LAST_PATCH_PATH
-from kani import init_rust_crate, run_kani
+import patches
+from patches import propose_patch, apply_patch_file
+from kani import init_rust_crate, run_kani_async, run_kani_many_async
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+try:
+    import readline
+except ImportError:  # not available on Windows; fall back to plain input()
+    readline = None
 
 
 # -------------------- tool definitions --------------------
@@ -85,60 +98,246 @@ TOOLS = [
             "additionalProperties": False,
         },
     },
+    {
+        "type": "function",
+        "name": "run_kani_many",
+        "description": "Run `cargo kani` for several Rust projects in one call; each job counts as one run_kani attempt.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "jobs": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "project_dir": {"type": "string", "description": "Relative dir under ./workspace containing Cargo.toml"},
+                            "args": {"type": ["array", "null"], "items": {"type": "string"}, "description": "Optional allowlisted cargo-kani args"},
+                        },
+                        "required": ["project_dir"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["jobs"],
+            "additionalProperties": False,
+        },
+    },
 ]
 
-
-def call_tool(name: str, args: Dict[str, Any]) -> str:
-    if name == "read_file":
-        return read_file(path=str(args["path"]))
-    if name == "write_file":
-        return write_file(
-            path=str(args["path"]),
-            content=str(args["content"]),
-            overwrite=bool(args.get("overwrite", False)),
-        )
-    if name == "propose_patch":
-        return propose_patch(diff=str(args["diff"]))
-    if name == "init_rust_crate":
-        return init_rust_crate(
-            project_dir=str(args["project_dir"]),
-            crate_name=args.get("crate_name"),
-            lib=bool(args.get("lib", True)),
-        )
-    if name == "run_kani":
-        return run_kani(
-            project_dir=str(args["project_dir"]),
-            args=args.get("args"),
-        )
-    return json.dumps({"ok": False, "error": f"Unknown tool: {name}"})
+_KANI_TOOLS = frozenset({"run_kani", "run_kani_many"})
+
+
+_DISPATCH: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    # the tool schemas already constrain argument types, so no str()/bool() coercion here
+    "read_file": lambda a: read_file(path=a["path"]),
+    "write_file": lambda a: write_file(
+        path=a["path"],
+        content=a["content"],
+        overwrite=a.get("overwrite", False),
+    ),
+    "propose_patch": lambda a: propose_patch(diff=a["diff"]),
+    "init_rust_crate": lambda a: init_rust_crate(
+        project_dir=a["project_dir"],
+        crate_name=a.get("crate_name"),
+        lib=a.get("lib", True),
+    ),
+}
+
+# tools that are coroutines themselves and run on the event loop
+_ASYNC_DISPATCH: Dict[str, Callable[[Dict[str, Any]], Awaitable[str]]] = {
+    "run_kani": lambda a: run_kani_async(project_dir=a["project_dir"], args=a.get("args")),
+    "run_kani_many": lambda a: run_kani_many_async(jobs=a["jobs"]),
+}
+
+
+async def call_tool(name: str, args: Dict[str, Any]) -> str:
+    try:
+        afn = _ASYNC_DISPATCH.get(name)
+        if afn is not None:
+            return await afn(args)
+        fn = _DISPATCH.get(name)
+        if fn is None:
+            return _dumps({"ok": False, "error": f"Unknown tool: {name}"})
+        # the file/patch tools block on disk IO; run them off the event loop so calls overlap
+        return await asyncio.to_thread(fn, args)
+    except KeyError as e:
+        return _dumps({"ok": False, "error": f"Missing argument: {e.args[0]}"})
+
+
+def _parse_args(raw: Any) -> Dict[str, Any]:
+    if isinstance(raw, dict):
+        return raw
+    if not raw or not isinstance(raw, (str, bytes, bytearray)):
+        return {}
+    try:
+        args = _loads(raw)
+    except JSONDecodeError:
+        return {}
+    return args if isinstance(args, dict) else {}
+
+
+def _kani_cost(tc: Any) -> int:
+    # a batch spends one attempt per job, so it cannot sidestep MAX_KANI_TRIES
+    if tc.name == "run_kani_many":
+        jobs = _parse_args(tc.arguments).get("jobs")
+        return max(1, len(jobs)) if isinstance(jobs, list) else 1
+    return 1
+
+
+def _print_kani_result(result: str) -> None:
+    try:
+        pretty = _dumps_pretty_bytes(_loads(result))
+    except JSONDecodeError:
+        print("\n=== run_kani OUTPUT ===")
+        print(result)
+        return
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:
+        print("\n=== run_kani OUTPUT ===")
+        print(pretty.decode("utf-8"))
+        return
+    # kani output can be tens of KB; hand the encoded bytes to stdout in one go
+    sys.stdout.flush()
+    out.write(b"\n=== run_kani OUTPUT ===\n" + pretty + b"\n")
+    out.flush()
 
 
 # -------------------- CLI loop --------------------
 
-@dataclass
+@dataclass(slots=True)
 class Usage:
     input_tokens: int = 0
     output_tokens: int = 0
+    last_input_tokens: int = 0  # size of the stored conversation as of the latest turn
 
     def add_from_response(self, response: Any) -> None:
-        u = getattr(response, "usage", None)
-        if not u:
+        u = response.usage
+        if u is None:
+            return
+        self.last_input_tokens = u.input_tokens or 0
+        self.input_tokens += self.last_input_tokens
+        self.output_tokens += u.output_tokens or 0
+
+
+async def _stream_response(client: AsyncOpenAI, **kwargs: Any) -> Any:
+    """Stream a response, echoing text deltas as they arrive; returns the final response."""
+    streamed = False
+    async with client.responses.stream(**kwargs) as stream:
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                print(event.delta, end="", flush=True)
+                streamed = True
+        response = await stream.get_final_response()
+    if streamed:
+        print()
+    return response
+
+
+def _make_client() -> AsyncOpenAI:
+    # openai/httpx pull in pydantic, anyio, ...; only pay for them once a client is needed
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    # one pooled HTTP/2 client reused for every turn, so TLS/TCP setup is paid once;
+    # the long keep-alive keeps the connection open while the user types
+    http_client = DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_keepalive_connections=16,
+            max_connections=40,
+            keepalive_expiry=config.OPENAI_KEEPALIVE_SECS,
+        ),
+        timeout=httpx.Timeout(600.0, connect=5.0),
+    )
+    return AsyncOpenAI(http_client=http_client, max_retries=config.OPENAI_MAX_RETRIES)
+
+
+HISTORY_FILE = os.path.expanduser("~/.basic_rust_history")
+_COMPLETIONS: List[str] = []
+
+
+def _complete_workspace(text: str, state: int) -> Optional[str]:
+    # complete workspace-relative paths, one directory level at a time
+    if state == 0:
+        head, _, prefix = text.rpartition("/")
+        base = config.WORKSPACE / head if head else config.WORKSPACE
+        try:
+            entries = sorted(os.scandir(base), key=lambda e: e.name)
+        except OSError:
+            entries = []
+        lead = f"{head}/" if head else ""
+        _COMPLETIONS[:] = [
+            lead + e.name + ("/" if e.is_dir() else "")
+            for e in entries
+            if e.name.startswith(prefix)
+        ]
+    return _COMPLETIONS[state] if state < len(_COMPLETIONS) else None
+
+
+def _save_history() -> None:
+    try:
+        readline.write_history_file(HISTORY_FILE)
+    except OSError:
+        pass
+
+
+def _setup_readline() -> None:
+    if readline is None:
+        return
+    try:
+        readline.read_history_file(HISTORY_FILE)
+    except (FileNotFoundError, PermissionError):
+        pass
+    atexit.register(_save_history)
+    readline.set_completer_delims(" \t\n'\"")
+    readline.set_completer(_complete_workspace)
+    readline.parse_and_bind("tab: complete")
+
+
+async def _read_line(prompt: str) -> str:
+    """input() on a daemon thread, so Ctrl-C at the prompt is not stuck behind a blocked executor join."""
+    loop = asyncio.get_running_loop()
+    fut: asyncio.Future[str] = loop.create_future()
+
+    def settle(value: Any, exc: Optional[BaseException]) -> None:
+        if fut.done():  # the await was cancelled while the read was blocked
             return
-        self.input_tokens += int(getattr(u, "input_tokens", 0) or 0)
-        self.output_tokens += int(getattr(u, "output_tokens", 0) or 0)
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(value)
 
+    def read() -> None:
+        try:
+            line = input(prompt)
+        except BaseException as e:  # EOFError/KeyboardInterrupt surface in the awaiting task
+            loop.call_soon_threadsafe(settle, None, e)
+        else:
+            loop.call_soon_threadsafe(settle, line, None)
 
-def main() -> int:
-    client = OpenAI()
+    threading.Thread(target=read, name="repl-input", daemon=True).start()
+    return await fut
+
+
+async def main() -> int:
+    _setup_readline()
+    client = _make_client()
+    try:
+        return await _repl(client)
+    finally:
+        await client.close()
+
+
+async def _repl(client: AsyncOpenAI) -> int:
     usage = Usage()
     run_dir = config.ensure_run_dir()
 
     instructions = (
         "You are a Rust coding assistant.\n"
         f"You may ONLY read/write files via read_file/write_file under {config.WORKSPACE}.\n"
-        "You may ONLY execute verification via run_kani (which runs `cargo kani` in Docker).\n"
+        "You may ONLY execute verification via run_kani, or run_kani_many for several crates (both run `cargo kani` in Docker).\n"
         "Never ask the user to run shell commands.\n"
-        f"You have at most {config.MAX_KANI_TRIES} total run_kani attempts per user request.\n"
+        f"You have at most {config.MAX_KANI_TRIES} total run_kani attempts per user request; each run_kani_many job counts as one.\n"
         "Workflow you MUST follow:\n"
         "0) Call init_rust_crate(project_dir=...) before writing Rust files.\n"
         "1) For existing files, propose unified diffs via propose_patch. Do NOT apply patches; wait for user approval.\n"
@@ -149,108 +348,128 @@ def main() -> int:
         "When calling run_kani, pass project_dir like 'demo' (NOT 'workspace/demo').\n"
     )
 
-    input_items: List[Dict[str, Any]] = []
+    # The conversation lives server-side (store=True); only items not yet sent are kept here.
+    pending: Deque[Dict[str, Any]] = deque()
+    last_response_id: Optional[str] = None
+    # per-turn scratch lists, cleared and refilled instead of reallocated every turn
+    tool_calls: List[Any] = []
+    runnable: List[Any] = []
+    skipped: List[Any] = []
     print(f"Run dir: {run_dir}")
     print(f"Workspace: {config.WORKSPACE}")
     print("Type '/clear' to reset, 'exit' to quit. Type 'Yes' to apply the last valid patch.\n")
 
     while True:
-        user = input("> ").strip()
+        user = (await _read_line("> ")).strip()
         if not user:
             continue
         if user == "exit":
             break
         if user == "/clear":
-            input_items = []
+            pending.clear()
+            last_response_id = None
             usage = Usage()
             print("(cleared)\n")
             continue
         if user.lower() == "yes":
-            from patches import LAST_PATCH_PATH as _LAST
-            if _LAST is None:
+            if patches.LAST_PATCH is None:
                 print("No pending patch to apply.\n")
                 continue
-            print(f"Applying last patch: {_LAST}")
-            apply_res = apply_patch_file(_LAST)
-            print(json.dumps(apply_res, indent=2))
+            patch_id, patch_path = patches.LAST_PATCH
+            print(f"Applying last patch: {patch_path}")
+            apply_res = apply_patch_file(patch_path, patch_id=patch_id)
+            print(_dumps_pretty(apply_res))
             if apply_res.get("ok"):
-                from patches import LAST_PATCH_PATH
-                LAST_PATCH_PATH = None
-            input_items.append({
+                patches.LAST_PATCH = None
+            pending.append({
                 "role": "assistant",
-                "content": f"Patch applied: {json.dumps(apply_res)}",
+                "content": f"Patch applied: {_dumps(apply_res)}",
             })
             continue
 
-        input_items.append({"role": "user", "content": user})
+        pending.append({"role": "user", "content": user})
         kani_tries = 0
 
         for _ in range(config.MAX_AGENT_TURNS):
-            response = client.responses.create(
+            response = await _stream_response(
+                client,
                 model=config.DEFAULT_MODEL,
                 instructions=instructions,
                 tools=TOOLS,
-                input=input_items,
+                input=list(pending),
+                previous_response_id=last_response_id,
+                store=True,
             )
             usage.add_from_response(response)
 
-            input_items += response.output
+            last_response_id = response.id
+            pending.clear()
+
+            # one pass over the output: collect function calls and apply the run_kani budget
+            tool_calls.clear()
+            runnable.clear()
+            skipped.clear()
+            for item in response.output:
+                if item.type != "function_call":
+                    continue
+                tool_calls.append(item)
+                if skipped:
+                    skipped.append(item)
+                    continue
+                if item.name in _KANI_TOOLS:
+                    kani_tries += _kani_cost(item)
+                    if kani_tries > config.MAX_KANI_TRIES:
+                        skipped.append(item)
+                        continue
+                runnable.append(item)
 
-            tool_calls = [item for item in response.output if item.type == "function_call"]
             if tool_calls:
-                stop_due_to_limit = False
-
-                for tc in tool_calls:
-                    try:
-                        raw_args = tc.arguments
-                        if isinstance(raw_args, str):
-                            args = json.loads(raw_args or "{}")
-                        elif isinstance(raw_args, dict):
-                            args = raw_args
-                        else:
-                            args = {}
-                    except Exception:
-                        args = {}
-
-                    if tc.name == "run_kani":
-                        kani_tries += 1
-                        if kani_tries > config.MAX_KANI_TRIES:
-                            msg = (
-                                f"Stopping: exceeded MAX_KANI_TRIES={config.MAX_KANI_TRIES}. "
-                                "Last run_kani output is above. "
-                                "Suggest revising the spec/harness or increasing the limit."
-                            )
-                            input_items.append({"role": "assistant", "content": msg})
-                            print(msg)
-                            stop_due_to_limit = True
-                            break
-
-                    result = call_tool(tc.name, args)
-
-                    if tc.name == "run_kani":
-                        print("\n=== run_kani OUTPUT ===")
-                        try:
-                            print(json.dumps(json.loads(result), indent=2))
-                        except Exception:
-                            print(result)
-
-                    input_items.append({
-                        "type": "function_call_output",
-                        "call_id": tc.call_id,
-                        "output": result,
-                    })
-
-                if stop_due_to_limit:
+                # file/crate calls overlap freely; run_kani waits for them so it
+                # verifies the files written in this same turn
+                results: Dict[str, str] = {}
+                batch = [tc for tc in runnable if tc.name not in _KANI_TOOLS]
+                kani_batch = [tc for tc in runnable if tc.name in _KANI_TOOLS]
+                for group in (batch, kani_batch):
+                    outs = await asyncio.gather(*[call_tool(tc.name, _parse_args(tc.arguments)) for tc in group])
+                    results.update(zip((tc.call_id for tc in group), outs))
+                for tc in kani_batch:
+                    _print_kani_result(results[tc.call_id])
+
+                # all outputs go back together as the next request's input
+                pending.extend(
+                    {"type": "function_call_output", "call_id": tc.call_id, "output": results[tc.call_id]}
+                    for tc in runnable
+                )
+
+                if skipped:
+                    msg = (
+                        f"Stopping: exceeded MAX_KANI_TRIES={config.MAX_KANI_TRIES}. "
+                        "Last run_kani output is above. "
+                        "Suggest revising the spec/harness or increasing the limit."
+                    )
+                    # every function_call in the stored response needs an output before the next turn
+                    skipped_output = _dumps({"ok": False, "error": msg})
+                    pending.extend(
+                        {"type": "function_call_output", "call_id": tc.call_id, "output": skipped_output}
+                        for tc in skipped
+                    )
+                    pending.append({"role": "assistant", "content": msg})
+                    print(msg)
                     break
                 continue
 
-            print(response.output_text)
             break
 
         print(f"\n[tokens] ↑ {usage.input_tokens} ↓ {usage.output_tokens}\n")
+        if usage.last_input_tokens > config.CONTEXT_WARN_TOKENS:
+            # every turn re-reads the whole stored history; old tool outputs keep costing tokens
+            print(
+                f"[context] last turn read {usage.last_input_tokens} input tokens "
+                f"(> {config.CONTEXT_WARN_TOKENS}); type '/clear' to start fresh.\n"
+            )
 
     return 0
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(asyncio.run(main()))
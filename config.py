@@ -1,56 +1,71 @@
 from __future__ import annotations
 
-import os
+import itertools
+import threading
 import time
 from pathlib import Path
 from typing import Optional
 
-from dotenv import load_dotenv
-
-load_dotenv()
+from settings import SETTINGS
 
+# Module-level aliases of the settings read once in settings.py
 # Workspace and run directories
-WORKSPACE = Path(os.getenv("CODE_WRITER_WORKSPACE", "./workspace")).resolve()
-WORKSPACE.mkdir(parents=True, exist_ok=True)
-
-RUN_ROOT = Path(os.getenv("CODE_WRITER_RUN_ROOT", Path(__file__).resolve().parent / "runs")).resolve()
-RUN_ROOT.mkdir(parents=True, exist_ok=True)
+WORKSPACE = SETTINGS.workspace
+RUN_ROOT = SETTINGS.run_root
 
 # Model / limits
-DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-5")
-MAX_BYTES = int(os.getenv("CODE_WRITER_MAX_BYTES", "200000"))
-MAX_AGENT_TURNS = int(os.getenv("CODE_WRITER_MAX_AGENT_TURNS", "15"))
-MAX_KANI_TRIES = int(os.getenv("CODE_WRITER_MAX_KANI_TRIES", "3"))
-KANI_DOCKER_IMAGE = os.getenv("KANI_DOCKER_IMAGE", "kani-runner:0.66")
-KANI_TIMEOUT_SECS = int(os.getenv("KANI_TIMEOUT_SECS", "300"))
+DEFAULT_MODEL = SETTINGS.default_model
+MAX_BYTES = SETTINGS.max_bytes
+READ_CACHE_SIZE = SETTINGS.read_cache_size
+MAX_AGENT_TURNS = SETTINGS.max_agent_turns
+CONTEXT_WARN_TOKENS = SETTINGS.context_warn_tokens
+MAX_KANI_TRIES = SETTINGS.max_kani_tries
+KANI_DOCKER_IMAGE = SETTINGS.kani_docker_image
+KANI_TIMEOUT_SECS = SETTINGS.kani_timeout_secs
+KANI_MAX_PARALLEL = SETTINGS.kani_max_parallel
+KANI_TARGET_VOLUME = SETTINGS.kani_target_volume
+
+# OpenAI HTTP client
+OPENAI_MAX_RETRIES = SETTINGS.openai_max_retries
+OPENAI_KEEPALIVE_SECS = SETTINGS.openai_keepalive_secs
 
 # UI signal limits
-UI_SIGNAL_MAX_BYTES = int(os.getenv("CODE_WRITER_UI_SIGNAL_MAX_BYTES", "400000"))
+UI_SIGNAL_MAX_BYTES = SETTINGS.ui_signal_max_bytes
+
+# Workspace path confinement
+RESOLVE_SYMLINKS = SETTINGS.resolve_symlinks
 
 # Patch approval
-REQUIRE_APPROVAL = True  # explicit "Yes" to apply
+REQUIRE_APPROVAL = SETTINGS.require_approval
+
+# Debugging
+DEBUG_PATH_CACHE = SETTINGS.debug_path_cache
 
 RUN_DIR: Optional[Path] = None
-PATCH_COUNTER = 0
+_RUN_DIR_LOCK = threading.Lock()  # tools run concurrently; only one of them may create the run dir
+_PATCH_IDS = itertools.count(1)
 
 
 def ensure_run_dir() -> Path:
     global RUN_DIR
     if RUN_DIR is not None:
         return RUN_DIR
-    tag_env = os.getenv("CODE_WRITER_RUN_TAG")
-    ts = int(time.time())
-    day_date = time.strftime("%a-%Y%m%d")
-    slug = f"{day_date}-{ts}"
-    if tag_env:
-        slug = f"{slug}-{tag_env}"
-    RUN_DIR = RUN_ROOT / f"run-{slug}"
-    RUN_DIR.mkdir(parents=True, exist_ok=True)
-    (RUN_DIR / "patches").mkdir(parents=True, exist_ok=True)
-    return RUN_DIR
+    with _RUN_DIR_LOCK:
+        if RUN_DIR is not None:
+            return RUN_DIR
+        tag_env = SETTINGS.run_tag
+        ts = int(time.time())
+        day_date = time.strftime("%a-%Y%m%d")
+        slug = f"{day_date}-{ts}"
+        if tag_env:
+            slug = f"{slug}-{tag_env}"
+        run_dir = RUN_ROOT / f"run-{slug}"
+        run_dir.mkdir(parents=True, exist_ok=True)
+        (run_dir / "patches").mkdir(parents=True, exist_ok=True)
+        RUN_DIR = run_dir
+        return RUN_DIR
 
 
 def next_patch_id() -> int:
-    global PATCH_COUNTER
-    PATCH_COUNTER += 1
-    return PATCH_COUNTER
+    # next() on itertools.count is atomic under the GIL, unlike `PATCH_COUNTER += 1`
+    return next(_PATCH_IDS)
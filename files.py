@@ -1,46 +1,95 @@
 from __future__ import annotations
 
-import json
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import Tuple
 
-from config import MAX_BYTES, REQUIRE_APPROVAL
+from codec import _dumps
+from config import MAX_BYTES, READ_CACHE_SIZE, REQUIRE_APPROVAL
 from paths import _safe_ws_path
 from ui_signal import _truncate_signal_text, write_ui_signal
 
 
+# abs path -> (mtime_ns, size, requested path, encoded result); a changed stat is a miss
+_READ_CACHE: "OrderedDict[str, Tuple[int, int, str, str]]" = OrderedDict()
+_READ_CACHE_LOCK = threading.Lock()  # tools run concurrently in worker threads
+
+
+def _invalidate_read_cache(fp: Path) -> None:
+    with _READ_CACHE_LOCK:
+        _READ_CACHE.pop(str(fp), None)
+
+
+def _read_text(file_path: str, limit: int) -> str:
+    # plain bounded read: a file truncated mid-read just comes back short, and one that grew
+    # past the size read_file already checked is refused rather than read in full
+    with open(file_path, "rb") as f:
+        data = f.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f"Too large (>{limit}).")
+    return data.decode("utf-8")
+
+
 def read_file(path: str) -> str:
     try:
         fp = _safe_ws_path(path)
-        if not fp.exists():
-            return json.dumps({"ok": False, "error": "File not found", "path": path})
-        return json.dumps({"ok": True, "path": path, "content": fp.read_text(encoding="utf-8")})
+        key = str(fp)
+        try:
+            st = os.stat(key)
+        except FileNotFoundError:
+            return _dumps({"ok": False, "error": "File not found", "path": path})
+        if st.st_size > MAX_BYTES:
+            return _dumps({"ok": False, "error": f"Too large ({st.st_size}>{MAX_BYTES}).", "path": path})
+
+        with _READ_CACHE_LOCK:
+            cached = _READ_CACHE.get(key)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size and cached[2] == path:
+                _READ_CACHE.move_to_end(key)
+                return cached[3]
+
+        result = _dumps({"ok": True, "path": path, "content": _read_text(key, MAX_BYTES)})
+        with _READ_CACHE_LOCK:
+            _READ_CACHE[key] = (st.st_mtime_ns, st.st_size, path, result)
+            _READ_CACHE.move_to_end(key)
+            while len(_READ_CACHE) > READ_CACHE_SIZE:
+                _READ_CACHE.popitem(last=False)
+        return result
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e), "path": path})
+        return _dumps({"ok": False, "error": str(e), "path": path})
 
 
 def write_file(path: str, content: str, overwrite: bool = False) -> str:
     try:
         fp = _safe_ws_path(path)
 
-        before = ""
-        if fp.exists():
+        # one open() answers "does it exist" and fetches the diff baseline
+        try:
             before = fp.read_text(encoding="utf-8")
+            existed = True
+        except FileNotFoundError:
+            before, existed = "", False
 
-        if fp.exists() and REQUIRE_APPROVAL:
-            return json.dumps({
+        if existed and REQUIRE_APPROVAL:
+            return _dumps({
                 "ok": False,
                 "error": "File exists. Use propose_patch + approval instead of write_file.",
                 "path": path,
             })
-        if fp.exists() and not overwrite:
-            return json.dumps({"ok": False, "error": "File exists; set overwrite=true.", "path": path})
+        if existed and not overwrite:
+            return _dumps({"ok": False, "error": "File exists; set overwrite=true.", "path": path})
 
+        # every char is at least one UTF-8 byte, so oversized text is rejected before encoding
+        if len(content) > MAX_BYTES:
+            return _dumps({"ok": False, "error": f"Too large ({len(content)} chars>{MAX_BYTES}).", "path": path})
         data = content.encode("utf-8")
         if len(data) > MAX_BYTES:
-            return json.dumps({"ok": False, "error": f"Too large ({len(data)}>{MAX_BYTES}).", "path": path})
+            return _dumps({"ok": False, "error": f"Too large ({len(data)}>{MAX_BYTES}).", "path": path})
 
         fp.parent.mkdir(parents=True, exist_ok=True)
-        fp.write_text(content, encoding="utf-8")
+        fp.write_bytes(data)
+        _invalidate_read_cache(fp)
 
         write_ui_signal({
             "event": "file_diff",
@@ -49,6 +98,6 @@ def write_file(path: str, content: str, overwrite: bool = False) -> str:
             "before": _truncate_signal_text(before),
             "after": _truncate_signal_text(content),
         })
-        return json.dumps({"ok": True, "path": path, "bytes_written": len(data)})
+        return _dumps({"ok": True, "path": path, "bytes_written": len(data)})
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e), "path": path})
+        return _dumps({"ok": False, "error": str(e), "path": path})
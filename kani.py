@@ -1,27 +1,86 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import atexit
+import hashlib
 import os
 import subprocess
-from typing import List, Optional
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
+from codec import _dumps
 from config import (
     WORKSPACE,
     KANI_DOCKER_IMAGE,
     KANI_TIMEOUT_SECS,
+    KANI_TARGET_VOLUME,
+    KANI_MAX_PARALLEL,
 )
 from paths import _safe_ws_dir
 
-_ALLOWED_KANI_ARGS = {
-    "--quiet",
-    "--verbose",
-    "--tests",
-    "--harness",
-    "--default-unwind",
-    "--unwind",
+# allowed kani flags -> number of values that follow them
+_KANI_ARG_ARITY: Dict[str, int] = {
+    "--quiet": 0,
+    "--verbose": 0,
+    "--tests": 0,
+    "--harness": 1,
+    "--default-unwind": 1,
+    "--unwind": 1,
 }
 
+# one warm container per agent process; run_kani work goes through `docker exec`
+_KANI_CONTAINER: Optional[str] = None
+_KANI_CONTAINER_LOCK = threading.Lock()
+
+# isolation and env are fixed at container create time and inherited by every exec
+_DOCKER_CREATE_OPTS = (
+    # tini as PID 1 reaps processes orphaned by killed or timed-out execs
+    "--init",
+    "--network", "none",
+    "--cap-drop", "ALL",
+    "--security-opt", "no-new-privileges",
+    "--pids-limit", "512",
+    "--memory", "6g",
+    "--cpus", "2",
+    # keep default user (root) for cached toolchain
+
+    "-e", "HOME=/root",
+    "-e", "RUSTUP_HOME=/root/.rustup",
+    "-e", "CARGO_HOME=/root/.cargo",
+    "-e", "RUSTUP_TOOLCHAIN=stable",
+
+    "-e", "CARGO_NET_OFFLINE=true",
+    "-e", "CARGO_INCREMENTAL=1",
+
+    "-v", f"{WORKSPACE}:/work",
+    # named volume (created by docker on first use) so builds survive container restarts
+    "-v", f"{KANI_TARGET_VOLUME}:/cache",
+)
+
+# the target volume is shared by every workspace and agent process; key each workspace's builds by
+# a hash of its path so two workspaces' "demo" crates never see each other's artifacts as fresh
+_TARGET_ROOT = "/cache/" + hashlib.blake2b(str(WORKSPACE).encode("utf-8"), digest_size=8).hexdigest()
+
+# per-call docker exec is just workdir, target dir and this, since everything else lives in the container
+_KANI_EXEC_CMD = ("cargo", "kani")
+
+# GNU timeout (coreutils) runs each exec in its own process group and signals that whole group on
+# expiry, so a slow run is killed without touching the shared container or other runs in it.
+# It exits 124 when TERM did the job, 137 when the KILL grace period had to follow.
+_KILL_GRACE_SECS = 10
+_TIMEOUT_EXIT_CODES = frozenset({124, 137})
+# backstop for a wedged docker client; the in-container timeout should always fire first
+_CLIENT_TIMEOUT_SLACK_SECS = 30
+
+# only the tail of kani's stdout/stderr is returned to the model
+_OUTPUT_TAIL_BYTES = 20000
+# matches the StreamReader buffer limit, so a verbose run drains in few wakeups
+_READ_CHUNK_BYTES = 65536
+
 
+@lru_cache(maxsize=512)
 def _normalize_project_dir(project_dir: str) -> str:
     p = (project_dir or "").strip()
     p = p.lstrip("./")
@@ -32,33 +91,133 @@ def _normalize_project_dir(project_dir: str) -> str:
 
 
 def _validate_kani_args(args: List[str]) -> List[str]:
-    out: List[str] = []
-    i = 0
-    while i < len(args):
+    # args are passed through unchanged once every flag (and its values) checks out
+    i, n = 0, len(args)
+    while i < n:
         a = args[i]
-        if a not in _ALLOWED_KANI_ARGS:
+        arity = _KANI_ARG_ARITY.get(a)
+        if arity is None:
             raise ValueError(f"Disallowed kani arg: {a}")
+        i += 1 + arity
+        if i > n:
+            raise ValueError(f"{a} requires a value")
+    return args
+
+
+def _container_running(cid: str) -> bool:
+    proc = subprocess.run(
+        ["docker", "inspect", "-f", "{{.State.Running}}", cid],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        close_fds=False,
+    )
+    return proc.returncode == 0 and proc.stdout.strip() == b"true"
+
+
+def _ensure_kani_container() -> str:
+    global _KANI_CONTAINER
+    with _KANI_CONTAINER_LOCK:
+        if _KANI_CONTAINER is not None:
+            if _container_running(_KANI_CONTAINER):
+                return _KANI_CONTAINER
+            # killed or OOM'd behind our back; clear any leftover so the name is free
+            subprocess.run(
+                ["docker", "rm", "-f", _KANI_CONTAINER],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=False,
+            )
+            _KANI_CONTAINER = None
+
+        create_cmd = [
+            "docker", "run", "-d", "--rm",
+            "--name", f"kani-warm-{os.getpid()}",
+            *_DOCKER_CREATE_OPTS,
+            KANI_DOCKER_IMAGE,
+            "tail", "-f", "/dev/null",
+        ]
+        proc = subprocess.run(
+            create_cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=False,
+        )
+        if proc.returncode != 0:
+            err = proc.stderr.decode("utf-8", "replace").strip()
+            raise RuntimeError(f"Could not start kani container: {err}")
+
+        _KANI_CONTAINER = proc.stdout.decode("ascii").strip()
+        return _KANI_CONTAINER
+
+
+def _remove_kani_container() -> None:
+    global _KANI_CONTAINER
+    with _KANI_CONTAINER_LOCK:
+        if _KANI_CONTAINER is None:
+            return
+        subprocess.run(
+            ["docker", "rm", "-f", _KANI_CONTAINER],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=False,
+        )
+        _KANI_CONTAINER = None
+
+
+atexit.register(_remove_kani_container)
+
+
+async def _read_tail(stream: asyncio.StreamReader, chunks: Deque[bytes]) -> None:
+    # keep just enough trailing chunks to cover _OUTPUT_TAIL_BYTES
+    size = 0
+    while chunk := await stream.read(_READ_CHUNK_BYTES):
+        chunks.append(chunk)
+        size += len(chunk)
+        while size - len(chunks[0]) >= _OUTPUT_TAIL_BYTES:
+            size -= len(chunks.popleft())
 
-        if a in {"--harness", "--default-unwind", "--unwind"}:
-            if i + 1 >= len(args):
-                raise ValueError(f"{a} requires a value")
-            out.extend([a, args[i + 1]])
-            i += 2
-            continue
 
-        out.append(a)
-        i += 1
-    return out
+def _tail_text(chunks: Deque[bytes]) -> str:
+    return b"".join(chunks)[-_OUTPUT_TAIL_BYTES:].decode("utf-8", "replace")
 
 
-def init_rust_crate(project_dir: str, crate_name: Optional[str] = None, lib: bool = True) -> str:
+async def _run_tail(cmd: List[str], timeout: float) -> Tuple[int, str, str]:
+    """Run cmd, keeping only the last _OUTPUT_TAIL_BYTES of stdout and stderr in memory."""
+    # Python's own fds are non-inheritable (PEP 446), so skip the close-every-fd pass before exec
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        close_fds=False,
+    )
+    out: Deque[bytes] = deque()
+    err: Deque[bytes] = deque()
+    readers = asyncio.gather(_read_tail(proc.stdout, out), _read_tail(proc.stderr, err))
     try:
-        project_dir = _normalize_project_dir(project_dir)
+        await asyncio.wait_for(proc.wait(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    finally:
+        await readers
+    return proc.returncode, _tail_text(out), _tail_text(err)
+
+
+def _init_rust_crate_impl(
+    project_dir: str,
+    crate_name: Optional[str] = None,
+    lib: bool = True,
+    already_normalized: bool = False,
+) -> Dict[str, Any]:
+    try:
+        if not already_normalized:
+            project_dir = _normalize_project_dir(project_dir)
         proj = _safe_ws_dir(project_dir)
 
         name = crate_name or os.path.basename(project_dir)
         if not name or not name.replace("_", "").isalnum():
-            return json.dumps({"ok": False, "error": f"Invalid crate name: {name}", "project_dir": project_dir})
+            return {"ok": False, "error": f"Invalid crate name: {name}", "project_dir": project_dir}
 
         (proj / "src").mkdir(parents=True, exist_ok=True)
         cargo_toml = proj / "Cargo.toml"
@@ -92,73 +251,115 @@ edition = "2021"
             entry.write_text(default_src, encoding="utf-8")
             created[entry_rel] = True
 
-        return json.dumps({"ok": True, "project_dir": project_dir, "path": str(proj), "created": created})
+        return {"ok": True, "project_dir": project_dir, "path": str(proj), "created": created}
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e), "project_dir": project_dir})
+        return {"ok": False, "error": str(e), "project_dir": project_dir}
+
 
+def init_rust_crate(
+    project_dir: str,
+    crate_name: Optional[str] = None,
+    lib: bool = True,
+    already_normalized: bool = False,
+) -> str:
+    return _dumps(_init_rust_crate_impl(project_dir, crate_name, lib, already_normalized))
 
-def run_kani(project_dir: str, args: Optional[List[str]] = None) -> str:
+
+async def _run_kani_impl(project_dir: str, args: Optional[List[str]] = None) -> Dict[str, Any]:
     try:
         project_dir = _normalize_project_dir(project_dir)
 
-        init_res = json.loads(init_rust_crate(project_dir))
-        if not init_res.get("ok"):
-            return json.dumps(init_res)
-
         proj = _safe_ws_dir(project_dir)
         cargo_toml = proj / "Cargo.toml"
+
+        # an existing crate is left as the model wrote it; only scaffold a missing one
         if not cargo_toml.exists():
-            return json.dumps({
-                "ok": False,
-                "error": f"Cargo.toml not found at {cargo_toml}",
-                "project_dir": project_dir,
-            })
+            init_res = await asyncio.to_thread(_init_rust_crate_impl, project_dir, already_normalized=True)
+            if not init_res["ok"]:
+                return init_res
 
         safe_args = _validate_kani_args(args or [])
 
         docker_cmd = [
-            "docker", "run", "--rm",
-            "--network", "none",
-            "--cap-drop", "ALL",
-            "--security-opt", "no-new-privileges",
-            "--pids-limit", "512",
-            "--memory", "6g",
-            "--cpus", "2",
-            # keep default user (root) for cached toolchain
-
-            "-e", "HOME=/root",
-            "-e", "RUSTUP_HOME=/root/.rustup",
-            "-e", "CARGO_HOME=/root/.cargo",
-            "-e", "RUSTUP_TOOLCHAIN=stable",
-
-            "-e", "CARGO_TARGET_DIR=/tmp/target",
-            "-e", "CARGO_NET_OFFLINE=true",
-
-            "-v", f"{WORKSPACE}:/work",
+            "docker", "exec",
             "-w", f"/work/{project_dir}",
-
-            KANI_DOCKER_IMAGE,
-            "cargo", "kani",
-        ] + safe_args
-
-        proc = subprocess.run(
-            docker_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=KANI_TIMEOUT_SECS,
+            "-e", f"CARGO_TARGET_DIR={_TARGET_ROOT}/{project_dir}",
+            await asyncio.to_thread(_ensure_kani_container),
+            "timeout", "-k", str(_KILL_GRACE_SECS), str(KANI_TIMEOUT_SECS),
+            *_KANI_EXEC_CMD,
+            *safe_args,
+        ]
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        returncode, stdout, stderr = await _run_tail(
+            docker_cmd, KANI_TIMEOUT_SECS + _KILL_GRACE_SECS + _CLIENT_TIMEOUT_SLACK_SECS
         )
+        # 137 alone could also be an OOM kill, so only count it as a timeout once the deadline passed
+        if returncode in _TIMEOUT_EXIT_CODES and loop.time() - started >= KANI_TIMEOUT_SECS:
+            return {
+                "ok": False,
+                "error": "Kani timed out",
+                "project_dir": project_dir,
+                "stdout": stdout,
+                "stderr": stderr,
+            }
 
-        return json.dumps({
+        return {
             "ok": True,
             "project_dir": project_dir,
-            "exit_code": proc.returncode,
-            "passed": proc.returncode == 0,
-            "stdout": proc.stdout[-20000:],
-            "stderr": proc.stderr[-20000:],
-        })
-
-    except subprocess.TimeoutExpired:
-        return json.dumps({"ok": False, "error": "Kani timed out", "project_dir": project_dir})
+            "exit_code": returncode,
+            "passed": returncode == 0,
+            "stdout": stdout,
+            "stderr": stderr,
+        }
+
+    except asyncio.TimeoutError:
+        # only the exec client was killed; the container, and other runs in it, stay up
+        return {"ok": False, "error": "Kani timed out", "project_dir": project_dir}
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e), "project_dir": project_dir})
+        return {"ok": False, "error": str(e), "project_dir": project_dir}
+
+
+# every exec shares the warm container's 6g/2-cpu budget; only KANI_MAX_PARALLEL run at once,
+# whether they come from separate run_kani calls or one run_kani_many batch
+_KANI_SLOTS: Optional[asyncio.Semaphore] = None
+
+
+def _kani_slots() -> asyncio.Semaphore:
+    global _KANI_SLOTS
+    if _KANI_SLOTS is None:
+        _KANI_SLOTS = asyncio.Semaphore(max(1, KANI_MAX_PARALLEL))
+    return _KANI_SLOTS
+
+
+async def run_kani_async(project_dir: str, args: Optional[List[str]] = None) -> str:
+    async with _kani_slots():
+        return _dumps(await _run_kani_impl(project_dir, args))
+
+
+def _prefix_lines(text: str, tag: str) -> str:
+    return "".join(f"{tag} {line}" for line in text.splitlines(keepends=True))
+
+
+async def run_kani_many_async(jobs: List[Dict[str, Any]]) -> str:
+    """
+    Run several {"project_dir", "args"} verifications, at most KANI_MAX_PARALLEL at a time.
+    Results keep the order of jobs; each stdout/stderr line is prefixed with [project_dir]
+    so output stays attributable when read side by side.
+    """
+    async def one(job: Dict[str, Any]) -> Dict[str, Any]:
+        async with _kani_slots():
+            res = await _run_kani_impl(job["project_dir"], job.get("args"))
+        tag = f"[{res.get('project_dir') or job['project_dir']}]"
+        for key in ("stdout", "stderr"):
+            if res.get(key):
+                res[key] = _prefix_lines(res[key], tag)
+        return res
+
+    results = await asyncio.gather(*(one(job) for job in jobs))
+    return _dumps({
+        "ok": all(r["ok"] for r in results),
+        "passed": bool(results) and all(r.get("passed", False) for r in results),
+        "results": results,
+    })
@@ -1,166 +1,500 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import re
 import subprocess
-import json
 import tempfile
 import shutil
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Tuple
 
+from codec import _dumps
 from config import WORKSPACE, UI_SIGNAL_MAX_BYTES, ensure_run_dir, next_patch_id
+from files import _invalidate_read_cache
 from paths import _safe_ws_path
-from ui_signal import _truncate_signal_text, write_ui_signal
+from ui_signal import _truncate_signal_bytes, _truncate_signal_text, write_ui_signal
 
-# Track last patch path for approval flow
-LAST_PATCH_PATH: Optional[Path] = None
+try:
+    import pygit2
+except ImportError:  # pygit2 is optional; patches are applied with the git CLI without it
+    pygit2 = None
+
+# Track last (patch_id, patch path) for approval flow
+LAST_PATCH: Optional[Tuple[int, Path]] = None
+# propose_patch calls from one turn run concurrently in worker threads and can finish in any
+# order; this guards LAST_PATCH and _DIFF_CACHE so the highest id wins
+_PATCH_STATE_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True, slots=True)
+class _FileState:
+    """One version of a file: enough to detect a change and signal the UI, without its full text."""
+    digest: bytes  # blake2b of the contents; b"" when the file does not exist
+    size: int
+    signal_text: str  # already truncated to UI_SIGNAL_MAX_BYTES
+
+
+# patch_id -> (diff text, {file: (before, after, (mtime_ns, size) at preview or None)}) for
+# recent proposals, so applying one re-reads neither the diff nor files that did not change
+_FilePreview = Tuple[_FileState, _FileState, Optional[Tuple[int, int]]]
+_DIFF_CACHE: "OrderedDict[int, Tuple[str, Dict[Path, _FilePreview]]]" = OrderedDict()
+_DIFF_CACHE_SIZE = 8
+
+# only the most recent proposals (and their apply logs) are kept in the run dir
+_PATCH_HISTORY = 64
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# (old_start, old_len, [(tag, text, ends_with_newline), ...]) with tag in " ", "-", "+"
+_Hunk = Tuple[int, int, List[Tuple[str, str, bool]]]
+
+
+class _HunkMismatch(ValueError):
+    """The diff is malformed or does not match the file exactly; git decides instead."""
+
+
+def _header_path(header: str) -> str:
+    # text after "--- "/"+++ "; a/ and b/ prefixes dropped, anything after a tab (timestamps) ignored
+    part = header.split("\t", 1)[0].strip()
+    if part.startswith("a/") or part.startswith("b/"):
+        part = part[2:]
+    return part
+
+
+def _parse_unified_diff(diff_text: str) -> List[Tuple[str, bool, List[_Hunk]]]:
+    """Split a unified diff into (new path, is_new_file, hunks) per file."""
+    files: List[Tuple[str, bool, List[_Hunk]]] = []
+    old_path = ""
+    lines = diff_text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if line.startswith("--- "):
+            old_path = _header_path(line[4:])
+        elif line.startswith("+++ "):
+            new_path = _header_path(line[4:])
+            if old_path not in (new_path, "/dev/null"):
+                raise _HunkMismatch(f"rename from {old_path}")
+            files.append((new_path, old_path == "/dev/null", []))
+        elif line.startswith("@@"):
+            m = _HUNK_HEADER_RE.match(line)
+            if m is None or not files:
+                raise _HunkMismatch(f"bad hunk header: {line}")
+            old_start = int(m.group(1))
+            old_left = int(m.group(2)) if m.group(2) is not None else 1
+            new_left = int(m.group(4)) if m.group(4) is not None else 1
+            ops: List[Tuple[str, str, bool]] = []
+            files[-1][2].append((old_start, old_left, ops))
+            while old_left > 0 or new_left > 0:
+                if i >= len(lines):
+                    raise _HunkMismatch("hunk ends early")
+                body = lines[i]
+                i += 1
+                tag, text = (body[0], body[1:]) if body else (" ", "")
+                if tag == "\\":
+                    # "\ No newline at end of file" marks the line just before it
+                    if ops:
+                        ops[-1] = (ops[-1][0], ops[-1][1], False)
+                    continue
+                if tag == " ":
+                    old_left -= 1
+                    new_left -= 1
+                elif tag == "-":
+                    old_left -= 1
+                elif tag == "+":
+                    new_left -= 1
+                else:
+                    raise _HunkMismatch(f"bad hunk line: {body}")
+                if old_left < 0 or new_left < 0:
+                    raise _HunkMismatch("hunk longer than its header")
+                ops.append((tag, text, True))
+            if i < len(lines) and lines[i].startswith("\\") and ops:
+                ops[-1] = (ops[-1][0], ops[-1][1], False)
+                i += 1
+    return files
+
+
+def _split_lines(text: str) -> List[str]:
+    # "\n" only, ends kept, like git; str.splitlines would also split on \r, \f, \x85, U+2028...
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _read_exact(p: Path) -> str:
+    # bytes as they are on disk; read_text would turn CRLF and lone CR into LF
+    return p.read_bytes().decode("utf-8")
+
+
+def _apply_hunks(before: str, hunks: List[_Hunk]) -> str:
+    src = _split_lines(before)
+    out: List[str] = []
+    pos = 0
+    for old_start, old_len, ops in hunks:
+        # a zero-length old range names the line the insertion follows
+        start = old_start - 1 if old_len else old_start
+        if start < pos or start > len(src):
+            raise _HunkMismatch("hunk out of order or past end of file")
+        out.extend(src[pos:start])
+        pos = start
+        for tag, text, eol in ops:
+            line = text + "\n" if eol else text
+            if tag == "+":
+                out.append(line)
+                continue
+            if pos >= len(src) or src[pos] != line:
+                raise _HunkMismatch("context does not match")
+            if tag == " ":
+                out.append(src[pos])
+            pos += 1
+        # like git apply, a hunk without trailing context must end the file
+        if ops and ops[-1][0] != " " and pos != len(src):
+            raise _HunkMismatch("hunk without trailing context is not at end of file")
+    out.extend(src[pos:])
+    return "".join(out)
+
+
+def _preview_in_process(diff_text: str) -> List[tuple[Path, str, str]]:
+    previews: Dict[Path, tuple[str, str]] = {}
+    for part, is_new, hunks in _parse_unified_diff(diff_text):
+        p = _safe_ws_path(part)
+        if p in previews:
+            before, current = previews[p]
+        else:
+            try:
+                before = _read_exact(p)
+            except FileNotFoundError:
+                if not is_new:
+                    raise _HunkMismatch(f"{part}: no such file")
+                before = ""
+            else:
+                if is_new:
+                    raise _HunkMismatch(f"{part}: already exists")
+            current = before
+        previews[p] = (before, _apply_hunks(current, hunks))
+    if not previews:
+        raise _HunkMismatch("no files in diff")
+    return [(p, before, after) for p, (before, after) in previews.items()]
 
 
 def _paths_from_diff(diff_text: str) -> List[Path]:
     files: List[Path] = []
-    for line in diff_text.splitlines():
-        if line.startswith("+++ "):
-            part = line[4:].strip()
-            # strip prefixes a/ b/
-            if part.startswith("a/") or part.startswith("b/"):
-                part = part[2:]
-            try:
-                p = _safe_ws_path(part)
-            except Exception:
-                continue
-            if p not in files:
-                files.append(p)
+    seen: Set[Path] = set()
+    # jump between "+++ " headers with find(); only the header text itself is ever sliced out
+    pos = 0
+    start = 4 if diff_text.startswith("+++ ") else 0
+    while True:
+        if not start:
+            idx = diff_text.find("\n+++ ", pos)
+            if idx < 0:
+                break
+            start = idx + 5
+        end = diff_text.find("\n", start)
+        if end < 0:
+            end = len(diff_text)
+        part = _header_path(diff_text[start:end])
+        pos, start = end, 0
+        try:
+            p = _safe_ws_path(part)
+        except Exception:
+            continue
+        if p not in seen:
+            seen.add(p)
+            files.append(p)
     return files
 
 
+def _preview_tmpdir() -> tempfile.TemporaryDirectory:
+    # next to the workspace so hardlinks stay on one filesystem; system tmp if that is not writable
+    try:
+        return tempfile.TemporaryDirectory(prefix=".cc_preview-", dir=WORKSPACE.parent)
+    except OSError:
+        return tempfile.TemporaryDirectory()
+
+
 def _preview_patch(patch_path: Path, diff_text: str) -> tuple[Optional[List[tuple[Path, str, str]]], Optional[str]]:
     """
-    Apply the patch to a temporary copy of the touched files to capture before/after
-    without modifying the workspace. Returns (previews, stderr). If previews is None,
-    stderr carries the git apply error.
+    Compute before/after for every touched file without modifying the workspace.
+    Exact-match diffs are applied in-process; anything else (offset hunks, deletions,
+    odd headers) is applied by git to a temporary copy of the touched files.
+    Returns (previews, stderr). If previews is None, stderr carries the git apply error.
     """
+    try:
+        return _preview_in_process(diff_text), None
+    except (_HunkMismatch, ValueError, OSError):
+        pass
+
     touched = _paths_from_diff(diff_text)
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
+        with _preview_tmpdir() as tmpdir:
             tmp_root = Path(tmpdir)
             for p in touched:
                 dst = tmp_root / p.relative_to(WORKSPACE)
                 dst.parent.mkdir(parents=True, exist_ok=True)
                 if p.exists():
-                    shutil.copy2(p, dst)
+                    # git apply replaces the files it patches rather than writing in place,
+                    # so a hardlink never lets the preview reach the workspace copy
+                    try:
+                        os.link(p, dst)
+                    except OSError:
+                        shutil.copy2(p, dst)
                 else:
                     dst.touch()
             proc = subprocess.run(
                 ["git", "apply", str(patch_path)],
                 cwd=tmp_root,
-                text=True,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
+                # the tempdir may sit inside a repo; git must not apply relative to that repo's root
+                env={**os.environ, "GIT_CEILING_DIRECTORIES": str(tmp_root.parent)},
             )
             if proc.returncode != 0:
-                return None, proc.stderr
+                return None, proc.stderr.decode("utf-8", "replace")
             previews: List[tuple[Path, str, str]] = []
             for p in touched:
-                before = p.read_text(encoding="utf-8") if p.exists() else ""
+                before = _read_exact(p) if p.exists() else ""
                 after_path = tmp_root / p.relative_to(WORKSPACE)
-                after = after_path.read_text(encoding="utf-8") if after_path.exists() else ""
+                after = _read_exact(after_path) if after_path.exists() else ""
                 previews.append((p, before, after))
             return previews, None
     except Exception as e:
         return None, str(e)
 
 
+def _diff_entry(p: Path, before: _FileState, after: _FileState) -> Dict[str, str]:
+    return {
+        "path": str(p.relative_to(WORKSPACE)),
+        "abs_path": str(p),
+        "before": before.signal_text,
+        "after": after.signal_text,
+    }
+
+
+def _stat_key(p: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(p)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _text_state(text: str) -> _FileState:
+    data = text.encode("utf-8")
+    return _FileState(_digest(data), len(data), _truncate_signal_text(text, UI_SIGNAL_MAX_BYTES))
+
+
+def _read_state(p: Path) -> _FileState:
+    try:
+        data = p.read_bytes()
+    except FileNotFoundError:
+        return _FileState(b"", 0, "")
+    return _FileState(_digest(data), len(data), _truncate_signal_bytes(data, UI_SIGNAL_MAX_BYTES))
+
+
+def _remember_diff(patch_id: int, diff_text: str, previews: List[tuple[Path, str, str]]) -> Dict[Path, _FilePreview]:
+    files: Dict[Path, _FilePreview] = {}
+    for p, _before, after in previews:
+        # stat first, then hash the raw bytes: the same digest _read_state gives after apply
+        stat = _stat_key(p)
+        files[p] = (_read_state(p), _text_state(after), stat)
+    _DIFF_CACHE[patch_id] = (diff_text, files)
+    while len(_DIFF_CACHE) > _DIFF_CACHE_SIZE:
+        _DIFF_CACHE.popitem(last=False)
+    return files
+
+
+def _preview_current(files: Dict[Path, _FilePreview]) -> bool:
+    """True if no touched file changed on disk since the preview read it."""
+    return all(_stat_key(p) == preview[2] for p, preview in files.items())
+
+
+def _patch_id_from_path(patch_path: Path) -> Optional[int]:
+    # inverse of the patch-XXXX.diff naming in propose_patch
+    _, _, digits = patch_path.stem.rpartition("-")
+    return int(digits) if digits.isdigit() else None
+
+
+def _drop_old_patch(run_dir: Path, patch_id: int) -> None:
+    if patch_id < 1:
+        return
+    stem = os.path.join(run_dir, "patches", f"patch-{patch_id:04d}")
+    for suffix in (".diff", ".apply.out", ".apply.err"):
+        try:
+            os.unlink(stem + suffix)
+        except FileNotFoundError:
+            pass
+
+
 def propose_patch(diff: str) -> str:
     try:
         run_dir = ensure_run_dir()
         patch_id = next_patch_id()
         patch_path = run_dir / "patches" / f"patch-{patch_id:04d}.diff"
         patch_path.write_text(diff, encoding="utf-8")
+        _drop_old_patch(run_dir, patch_id - _PATCH_HISTORY)
         previews, preview_err = _preview_patch(patch_path, diff)
         if previews:
-            global LAST_PATCH_PATH
-            LAST_PATCH_PATH = patch_path
-            for p, before, after in previews:
-                write_ui_signal({
-                    "event": "file_diff",
-                    "path": str(p.relative_to(WORKSPACE)),
-                    "abs_path": str(p),
-                    "before": _truncate_signal_text(before, UI_SIGNAL_MAX_BYTES),
-                    "after": _truncate_signal_text(after, UI_SIGNAL_MAX_BYTES),
-                })
+            global LAST_PATCH
+            with _PATCH_STATE_LOCK:
+                files = _remember_diff(patch_id, diff, previews)
+                if LAST_PATCH is None or patch_id > LAST_PATCH[0]:
+                    LAST_PATCH = (patch_id, patch_path)
+            # one event per patch so the extension sees every file from the same snapshot
+            write_ui_signal({
+                "event": "patch_diff",
+                "patch_id": patch_id,
+                "path": str(patch_path),
+                "files": [_diff_entry(p, before, after) for p, (before, after, _) in files.items()],
+            })
         else:
-            return json.dumps({
+            return _dumps({
                 "ok": False,
                 "error": "Patch preview failed (invalid diff or git apply failure).",
                 "stderr": preview_err or "",
             })
-        return json.dumps({
+        return _dumps({
             "ok": True,
             "patch_id": patch_id,
             "path": str(patch_path),
             "message": "Patch recorded. User must reply 'Yes' to apply the last patch.",
         })
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e)})
+        return _dumps({"ok": False, "error": str(e)})
+
+
+@lru_cache(maxsize=1)
+def _workspace_repo() -> Optional[Any]:
+    # libgit2 applies relative to the repo root, so only use it when the workspace is that root
+    if pygit2 is None:
+        return None
+    try:
+        repo = pygit2.Repository(str(WORKSPACE))
+    except (pygit2.GitError, KeyError):
+        return None
+    if repo.is_bare or os.path.realpath(repo.workdir) != str(WORKSPACE):
+        return None
+    return repo
+
+
+def _apply_in_process(diff_text: str) -> bool:
+    """Apply the diff to the workspace with libgit2; False means fall back to the git CLI."""
+    repo = _workspace_repo()
+    if repo is None:
+        return False
+    try:
+        repo.apply(pygit2.Diff.parse_diff(diff_text))
+    except pygit2.GitError:
+        return False
+    return True
+
 
+def _run_git(cmd: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        cmd,
+        cwd=WORKSPACE,
+        input=None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
 
-def apply_patch_file(patch_path: Path) -> Dict[str, Any]:
+
+def _apply_with_git(patch_path: Path, out_parts: List[bytes], err_parts: List[bytes]) -> Optional[Dict[str, Any]]:
+    """Apply with the git CLI; returns the error fields on failure, None on success."""
+    # git apply is all-or-nothing, so a separate --check pass only matters on failure
+    apply = _run_git(["git", "apply", str(patch_path)])
+    out_parts.append(apply.stdout)
+    err_parts.append(apply.stderr)
+    if apply.returncode == 0:
+        return None
+    check = _run_git(["git", "apply", "--check", "-v", str(patch_path)])
+    out_parts.append(check.stdout)
+    err_parts.append(check.stderr)
+    return {
+        "ok": False,
+        "error": "git apply failed",
+        "stderr": apply.stderr.decode("utf-8", "replace"),
+        "check_stderr": check.stderr.decode("utf-8", "replace"),
+    }
+
+
+def _write_apply_logs(patch_path: Path, out_parts: List[bytes], err_parts: List[bytes]) -> None:
+    try:
+        patch_path.with_suffix(".apply.out").write_bytes(b"".join(out_parts))
+        patch_path.with_suffix(".apply.err").write_bytes(b"".join(err_parts))
+    except OSError:
+        pass
+
+
+def apply_patch_file(patch_path: Path, patch_id: Optional[int] = None) -> Dict[str, Any]:
     result: Dict[str, Any] = {"ok": False, "path": str(patch_path)}
     if not patch_path.exists():
         result["error"] = "Patch file not found"
         return result
 
-    diff_text = patch_path.read_text(encoding="utf-8")
-    touched = _paths_from_diff(diff_text)
-    before: Dict[Path, str] = {}
-    for p in touched:
-        if p.exists():
-            before[p] = p.read_text(encoding="utf-8")
+    preview: Optional[Dict[Path, _FilePreview]] = None
+    cached = _DIFF_CACHE.get(patch_id) if patch_id is not None else None
+    if cached is not None:
+        diff_text, files = cached
+        touched = list(files)
+        if _preview_current(files):
+            preview = files
+    else:
+        diff_text = patch_path.read_text(encoding="utf-8")
+        touched = _paths_from_diff(diff_text)
+    # hashes and truncated UI text only; full file contents are never held across the apply
+    if preview is not None:
+        before = {p: preview[p][0] for p in touched}
+    else:
+        before = {p: _read_state(p) for p in touched}
+
+    # apply output is logged next to the patch, written once at the end
+    out_parts: List[bytes] = []
+    err_parts: List[bytes] = []
+    try:
+        if _apply_in_process(diff_text):
+            out_parts.append(b"applied in-process via libgit2\n")
         else:
-            before[p] = ""
-
-    def _run(cmd: List[str]) -> subprocess.CompletedProcess:
-        return subprocess.run(
-            cmd,
-            cwd=WORKSPACE,
-            text=True,
-            input=None,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-
-    check = _run(["git", "apply", "--check", str(patch_path)])
-    if check.returncode != 0:
-        result.update({
-            "ok": False,
-            "error": "git apply --check failed",
-            "stderr": check.stderr,
-        })
-        return result
+            failure = _apply_with_git(patch_path, out_parts, err_parts)
+            if failure is not None:
+                result.update(failure)
+                return result
+    finally:
+        _write_apply_logs(patch_path, out_parts, err_parts)
 
-    apply = _run(["git", "apply", str(patch_path)])
-    if apply.returncode != 0:
-        result.update({
-            "ok": False,
-            "error": "git apply failed",
-            "stderr": apply.stderr,
-        })
-        return result
+    for p in touched:
+        _invalidate_read_cache(p)
 
     # Detect no-op applies (e.g., patch already applied or failed silently)
     unchanged = True
     after_info: List[Dict[str, str]] = []
+    entries: List[Dict[str, str]] = []
     for p in touched:
-        after = p.read_text(encoding="utf-8") if p.exists() else ""
-        if after != before.get(p, ""):
+        # always read back: a matching size proves nothing about what git or libgit2 wrote
+        after = _read_state(p)
+        if after.digest != before[p].digest:
             unchanged = False
-        after_info.append({"path": str(p), "bytes": len(after.encode("utf-8"))})
-        write_ui_signal({
-            "event": "file_diff",
-            "path": str(p.relative_to(WORKSPACE)),
-            "abs_path": str(p),
-            "before": _truncate_signal_text(before.get(p, ""), UI_SIGNAL_MAX_BYTES),
-            "after": _truncate_signal_text(after, UI_SIGNAL_MAX_BYTES),
-        })
+        after_info.append({"path": str(p), "bytes": after.size})
+        entries.append(_diff_entry(p, before[p], after))
+    write_ui_signal({
+        "event": "patch_diff",
+        "patch_id": patch_id if patch_id is not None else _patch_id_from_path(patch_path),
+        "path": str(patch_path),
+        "files": entries,
+    })
 
     if unchanged:
         result.update({
@@ -1,43 +1,80 @@
 from __future__ import annotations
 
+import atexit
+import os
+import sys
+from functools import lru_cache
 from pathlib import Path
 
-from config import WORKSPACE
+from config import DEBUG_PATH_CACHE, RESOLVE_SYMLINKS, WORKSPACE
 
 ALLOWED_SUFFIXES = {".py", ".rs", ".toml", ".lock", ".md", ".txt"}
+_ALLOWED_SUFFIXES_LOWER = frozenset(s.lower() for s in ALLOWED_SUFFIXES)
 
+# WORKSPACE is already resolved by config; keep its string form for prefix checks
+_WS_RESOLVED = str(WORKSPACE)
+_WS_PREFIX = _WS_RESOLVED + os.sep
+_SEPS = (os.sep, os.altsep) if os.altsep else (os.sep,)
 
-def _safe_ws_path(rel_path: str) -> Path:
-    p = Path(rel_path)
 
-    if p.is_absolute() or p.drive:
+def _check_relative(rel_path: str) -> None:
+    if os.path.isabs(rel_path) or os.path.splitdrive(rel_path)[0]:
         raise ValueError("Absolute/drive paths are not allowed.")
-    if ".." in p.parts:
+    parts = rel_path
+    for sep in _SEPS[1:]:
+        parts = parts.replace(sep, os.sep)
+    if ".." in parts.split(os.sep):
         raise ValueError("Path traversal ('..') is not allowed.")
-    if not p.suffix:
-        raise ValueError("Path must include a file extension.")
-    if p.suffix.lower() not in ALLOWED_SUFFIXES:
-        raise ValueError(f"File type not allowed: {p.suffix}")
 
-    resolved = (WORKSPACE / p).resolve()
-    try:
-        resolved.relative_to(WORKSPACE)
-    except ValueError:
+
+def _resolve_in_workspace(rel_path: str) -> Path:
+    # "..", absolute and drive paths are already rejected, so normpath alone keeps the path
+    # lexically inside; realpath also catches symlinks (e.g. ones git apply created) leading out.
+    # Never cached: a directory can be swapped for a symlink between two calls.
+    joined = os.path.join(_WS_RESOLVED, rel_path)
+    full = os.path.realpath(joined) if RESOLVE_SYMLINKS else os.path.normpath(joined)
+    if full != _WS_RESOLVED and not full.startswith(_WS_PREFIX):
         raise ValueError("Path escapes workspace.")
-    return resolved
+    return Path(full)
+
+
+# only the lexical rules are memoized; they depend on nothing but the string itself
+@lru_cache(maxsize=4096)
+def _check_file_path(rel_path: str) -> None:
+    _check_relative(rel_path)
+
+    # same rule as PurePath.suffix: last dot in the final component, not a leading one
+    name = os.path.basename(rel_path.rstrip("".join(_SEPS)))
+    stem, dot, ext = name.rpartition(".")
+    if not dot or not stem.strip(".") or not ext:
+        raise ValueError("Path must include a file extension.")
+    suffix = dot + ext
+    if suffix.lower() not in _ALLOWED_SUFFIXES_LOWER:
+        raise ValueError(f"File type not allowed: {suffix}")
+
+
+@lru_cache(maxsize=4096)
+def _check_dir_path(rel_dir: str) -> None:
+    _check_relative(rel_dir)
+
+
+# callers may pass Path objects; str() keeps one cache entry per spelling of the path
+def _safe_ws_path(rel_path: str) -> Path:
+    rel_path = str(rel_path)
+    _check_file_path(rel_path)
+    return _resolve_in_workspace(rel_path)
 
 
 def _safe_ws_dir(rel_dir: str) -> Path:
-    p = Path(rel_dir)
+    rel_dir = str(rel_dir)
+    _check_dir_path(rel_dir)
+    return _resolve_in_workspace(rel_dir)
 
-    if p.is_absolute() or p.drive:
-        raise ValueError("Absolute/drive paths are not allowed.")
-    if ".." in p.parts:
-        raise ValueError("Path traversal ('..') is not allowed.")
 
-    resolved = (WORKSPACE / p).resolve()
-    try:
-        resolved.relative_to(WORKSPACE)
-    except ValueError:
-        raise ValueError("Path escapes workspace.")
-    return resolved
+def _report_cache_info() -> None:
+    print(f"[paths] _check_file_path {_check_file_path.cache_info()}", file=sys.stderr)
+    print(f"[paths] _check_dir_path {_check_dir_path.cache_info()}", file=sys.stderr)
+
+
+if DEBUG_PATH_CACHE:
+    atexit.register(_report_cache_info)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    # Workspace and run directories
+    workspace: Path
+    run_root: Path
+    run_tag: Optional[str]
+
+    # Model / limits
+    default_model: str
+    max_bytes: int
+    read_cache_size: int
+    max_agent_turns: int
+    context_warn_tokens: int
+    max_kani_tries: int
+    kani_docker_image: str
+    kani_timeout_secs: int
+    kani_max_parallel: int
+    kani_target_volume: str
+
+    # OpenAI HTTP client
+    openai_max_retries: int
+    openai_keepalive_secs: float
+
+    # UI signal limits
+    ui_signal_max_bytes: int
+
+    # Workspace path confinement
+    resolve_symlinks: bool
+
+    # Debugging
+    debug_path_cache: bool
+
+    # Patch approval
+    require_approval: bool = True  # explicit "Yes" to apply
+
+
+def _load() -> Settings:
+    """Read the environment (and .env) once, resolving and creating the directories."""
+    load_dotenv()
+
+    workspace = Path(os.getenv("CODE_WRITER_WORKSPACE", "./workspace")).resolve()
+    workspace.mkdir(parents=True, exist_ok=True)
+
+    # abspath is pure string work; the resolve() below canonicalizes whichever root is used
+    default_run_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs")
+    run_root = Path(os.getenv("CODE_WRITER_RUN_ROOT", default_run_root)).resolve()
+    run_root.mkdir(parents=True, exist_ok=True)
+
+    return Settings(
+        workspace=workspace,
+        run_root=run_root,
+        run_tag=os.getenv("CODE_WRITER_RUN_TAG"),
+        default_model=os.getenv("OPENAI_MODEL", "gpt-5"),
+        max_bytes=int(os.getenv("CODE_WRITER_MAX_BYTES", "200000")),
+        read_cache_size=int(os.getenv("CODE_WRITER_READ_CACHE_SIZE", "128")),  # files kept by read_file
+        max_agent_turns=int(os.getenv("CODE_WRITER_MAX_AGENT_TURNS", "15")),
+        context_warn_tokens=int(os.getenv("CODE_WRITER_CONTEXT_WARN_TOKENS", "100000")),
+        max_kani_tries=int(os.getenv("CODE_WRITER_MAX_KANI_TRIES", "3")),
+        kani_docker_image=os.getenv("KANI_DOCKER_IMAGE", "kani-runner:0.66"),
+        kani_timeout_secs=int(os.getenv("KANI_TIMEOUT_SECS", "300")),
+        kani_max_parallel=int(os.getenv("KANI_MAX_PARALLEL", "1")),  # concurrent run_kani execs
+        kani_target_volume=os.getenv("KANI_TARGET_VOLUME", "kani-target-cache"),  # persists cargo target dirs
+        openai_max_retries=int(os.getenv("CODE_WRITER_OPENAI_MAX_RETRIES", "0")),
+        openai_keepalive_secs=float(os.getenv("CODE_WRITER_OPENAI_KEEPALIVE_SECS", "60")),
+        ui_signal_max_bytes=int(os.getenv("CODE_WRITER_UI_SIGNAL_MAX_BYTES", "400000")),
+        resolve_symlinks=os.getenv("CODE_WRITER_RESOLVE_SYMLINKS", "1") != "0",  # realpath-check workspace paths
+        debug_path_cache=os.getenv("CODE_WRITER_DEBUG_PATH_CACHE", "") == "1",  # print path-cache stats at exit
+    )
+
+
+SETTINGS = _load()
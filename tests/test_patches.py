@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+_TMP = tempfile.mkdtemp(prefix="coding_checker_test_")
+os.environ["CODE_WRITER_WORKSPACE"] = os.path.join(_TMP, "workspace")
+os.environ["CODE_WRITER_RUN_ROOT"] = os.path.join(_TMP, "runs")
+os.environ.pop("VSCODE_PID", None)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import patches  # noqa: E402
+from codec import _loads  # noqa: E402
+
+WS = Path(os.environ["CODE_WRITER_WORKSPACE"])
+
+
+def _diff(name: str, eol: str) -> str:
+    return (
+        f"--- a/{name}\n+++ b/{name}\n@@ -1,2 +1,2 @@\n"
+        f" fn a() {{}}{eol}\n-fn b() {{}}{eol}\n+fn c() {{}}{eol}\n"
+    )
+
+
+class CrlfPreviewTest(unittest.TestCase):
+    def setUp(self) -> None:
+        WS.mkdir(parents=True, exist_ok=True)
+        self.path = WS / "crlf.rs"
+        self.path.write_bytes(b"fn a() {}\r\nfn b() {}\r\n")
+
+    def test_lf_diff_does_not_match_crlf_file(self) -> None:
+        diff = _diff("crlf.rs", "")
+        with self.assertRaises(patches._HunkMismatch):
+            patches._preview_in_process(diff)
+        self.assertFalse(_loads(patches.propose_patch(diff))["ok"])
+
+    def test_crlf_diff_keeps_crlf_endings(self) -> None:
+        [(path, before, after)] = patches._preview_in_process(_diff("crlf.rs", "\r"))
+        self.assertEqual(path, self.path)
+        self.assertEqual(before, "fn a() {}\r\nfn b() {}\r\n")
+        self.assertEqual(after, "fn a() {}\r\nfn c() {}\r\n")
+
+    def test_cached_before_state_hashes_raw_bytes(self) -> None:
+        patch_id = _loads(patches.propose_patch(_diff("crlf.rs", "\r")))["patch_id"]
+        before, _after, _stat = patches._DIFF_CACHE[patch_id][1][self.path]
+        self.assertEqual(before, patches._read_state(self.path))
+
+    def test_only_newline_splits_lines(self) -> None:
+        self.assertEqual(patches._split_lines("a\x0cb\r\nc d"), ["a\x0cb\r\n", "c d"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,38 +1,125 @@
 from __future__ import annotations
 
-import json
+import atexit
 import os
+import queue
+import threading
 import time
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
+from codec import _dumps_bytes
 from config import UI_SIGNAL_MAX_BYTES
 
-SCRIPT_DIR = Path(__file__).resolve().parent
+SCRIPT_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 UI_SIGNAL_DIR = SCRIPT_DIR / ".coding_checker"
 UI_SIGNAL_FILE = UI_SIGNAL_DIR / "ui.signal.json"
+# written then renamed over UI_SIGNAL_FILE so the extension never reads a half-written payload
+_UI_SIGNAL_TMP = UI_SIGNAL_DIR / "ui.signal.json.tmp"
+
+# the extension only watches when the agent runs in a VS Code terminal; that cannot change mid-run
+_UI_ACTIVE = bool(os.getenv("VSCODE_PID") or os.getenv("TERM_PROGRAM") == "vscode")
+_PID = os.getpid()
+
+# the signal file is last-state-wins, so a background writer only ever writes the newest payload;
+# None is the shutdown sentinel
+_SIGNAL_Q: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=64)
+_SIGNAL_THREAD: Optional[threading.Thread] = None
+_SIGNAL_THREAD_LOCK = threading.Lock()
 
 
 def _truncate_signal_text(text: str, max_bytes: int = UI_SIGNAL_MAX_BYTES) -> str:
     if not text:
         return ""
-    data = text.encode("utf-8")
-    if len(data) <= max_bytes:
+    n = len(text)
+    # utf-8 needs at most 4 bytes per char, so short text fits without measuring it
+    if n * 4 <= max_bytes:
         return text
-    clipped = data[:max_bytes].decode("utf-8", errors="ignore")
+    if text.isascii():
+        # one byte per char: measure and slice the str without encoding it
+        if n <= max_bytes:
+            return text
+        return text[:max_bytes] + "\n...[truncated]\n"
+    # every char is at least one byte, so only the first max_bytes chars can fit; encode just those
+    head = text[:max_bytes].encode("utf-8")
+    if n <= max_bytes and len(head) <= max_bytes:
+        return text
+    clipped = head[:max_bytes].decode("utf-8", errors="ignore")
     return clipped + "\n...[truncated]\n"
 
 
-def write_ui_signal(payload: Dict[str, Any]) -> None:
+def _truncate_signal_bytes(data: bytes, max_bytes: int = UI_SIGNAL_MAX_BYTES) -> str:
+    # same result as _truncate_signal_text(data.decode()), decoding at most max_bytes
+    if len(data) <= max_bytes:
+        return data.decode("utf-8", errors="replace")
+    return data[:max_bytes].decode("utf-8", errors="ignore") + "\n...[truncated]\n"
+
+
+def _write_signal_file(data: bytes) -> None:
+    UI_SIGNAL_DIR.mkdir(parents=True, exist_ok=True)
+    fd = os.open(_UI_SIGNAL_TMP, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
     try:
-        if not (os.getenv("VSCODE_PID") or os.getenv("TERM_PROGRAM") == "vscode"):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    os.replace(_UI_SIGNAL_TMP, UI_SIGNAL_FILE)
+
+
+def _signal_writer() -> None:
+    while True:
+        batch = [_SIGNAL_Q.get()]
+        while True:
+            try:
+                batch.append(_SIGNAL_Q.get_nowait())
+            except queue.Empty:
+                break
+        latest = next((p for p in reversed(batch) if p is not None), None)
+        if latest is not None:
+            try:
+                _write_signal_file(_dumps_bytes(latest))
+            except Exception:
+                pass
+        if None in batch:
             return
-        UI_SIGNAL_DIR.mkdir(parents=True, exist_ok=True)
-        payload = {
-            **payload,
-            "time": time.time(),
-            "pid": os.getpid(),
-        }
-        UI_SIGNAL_FILE.write_text(json.dumps(payload), encoding="utf-8")
+
+
+def _ensure_signal_writer() -> None:
+    global _SIGNAL_THREAD
+    with _SIGNAL_THREAD_LOCK:
+        if _SIGNAL_THREAD is None:
+            _SIGNAL_THREAD = threading.Thread(target=_signal_writer, name="ui-signal", daemon=True)
+            _SIGNAL_THREAD.start()
+            atexit.register(_flush_ui_signals)
+
+
+def _flush_ui_signals() -> None:
+    # let the writer land the last payload before the process exits
+    try:
+        _SIGNAL_Q.put(None, timeout=1.0)
+    except queue.Full:
+        return
+    if _SIGNAL_THREAD is not None:
+        _SIGNAL_THREAD.join(timeout=1.0)
+
+
+def write_ui_signal(payload: Dict[str, Any]) -> None:
+    """Queue payload for the UI; it is stamped in place, so callers must pass a fresh dict."""
+    if not _UI_ACTIVE:
+        return
+    try:
+        payload["time"] = time.time()
+        payload["pid"] = _PID
+        _ensure_signal_writer()
+        try:
+            _SIGNAL_Q.put_nowait(payload)
+        except queue.Full:
+            # drop the oldest; only the newest payload is ever written anyway
+            try:
+                _SIGNAL_Q.get_nowait()
+            except queue.Empty:
+                pass
+            _SIGNAL_Q.put_nowait(payload)
     except Exception:
         pass
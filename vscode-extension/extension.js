@@ -20,12 +20,7 @@ function activate(context) {
 
   let latestPayload = null
 
-  const openDiffFromPayload = async (payload) => {
-    if (!payload) {
-      vscode.window.showInformationMessage("No Coding Checker diff available yet.")
-      return
-    }
-
+  const openFileDiff = async (payload) => {
     const fileLabel = payload.path || payload.abs_path || "unknown"
     const beforeUri = buildVirtualUri(fileLabel, "before")
     contentByUri.set(beforeUri.toString(), payload.before || "")
@@ -44,6 +39,19 @@ function activate(context) {
     await vscode.commands.executeCommand("vscode.diff", beforeUri, rightUri, title)
   }
 
+  const openDiffFromPayload = async (payload) => {
+    if (!payload) {
+      vscode.window.showInformationMessage("No Coding Checker diff available yet.")
+      return
+    }
+
+    // patch_diff carries every touched file; file_diff is the older one-file-per-signal event
+    const files = payload.event === "patch_diff" ? payload.files || [] : [payload]
+    for (const file of files) {
+      await openFileDiff(file)
+    }
+  }
+
   const handleSignal = async (signalUri) => {
     let payload
     try {
@@ -53,7 +61,7 @@ function activate(context) {
       return
     }
 
-    if (!payload || payload.event !== "file_diff") {
+    if (!payload || (payload.event !== "file_diff" && payload.event !== "patch_diff")) {
       return
     }
 